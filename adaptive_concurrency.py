@@ -0,0 +1,263 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class _Epoch:
+    def __init__(self, size: int):
+        self.size = size
+        self.dispatched = 0
+        self.done = 0
+        self.ok = 0
+        self.latency_sum = 0.0  # по успешным запросам
+        self.work = 0.0         # их токены (или символы входа, если токенов нет)
+        self.failed = False
+        self.peak = 0        # максимум запросов в полёте, пока эпоха отправлялась
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD-контроллер числа одновременных запросов к одному инстансу Ollama.
+
+    Эпоха — это limit запросов, ОТПРАВЛЕННЫХ при данном лимите; она оценивается, когда
+    все они завершились (измерения разных эпох не смешиваются). По итогам эпохи:
+    - были ошибки / таймауты                              → limit *= decrease_factor
+    - задержка на токен > baseline * tolerance
+      congestion_epochs эпох подряд                         → limit *= decrease_factor
+      (меньше эпох подряд)                                  → limit не меняем
+    - лимит реально выбран (в полёте было limit)           → limit += 1
+    - иначе (вызывающих меньше лимита)                     → limit не меняем
+
+    Задержка на токен эпохи — сумма задержек / сумма сгенерированных токенов (а не среднее
+    отношений: короткие ответы с дорогим префиллом не перевешивают длинные).
+    baseline — baseline_quantile-квантиль этой величины по последним baseline_window эпохам:
+    в отличие от минимума, одна удачная эпоха его не занижает, а обычный шум и разный
+    размер промптов не выглядят как перегрузка; требование нескольких эпох подряд
+    отсекает одиночные выбросы.
+
+    throughput_tps в метриках — реальный темп завершения: токены запросов, завершённых
+    за последние rate_window секунд, делённые на время между первым и последним из них.
+
+    Таймаут запроса подстраивается под размер входа по наблюдаемому времени на символ;
+    после ошибки/таймаута оценка удваивается.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 1,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        decrease_factor: float = 0.7,
+        latency_tolerance: float = 1.3,
+        baseline_window: int = 50,
+        baseline_quantile: float = 0.25,
+        congestion_epochs: int = 2,
+        min_timeout: float = 60.0,
+        max_timeout: float = 60 * 20,
+        timeout_factor: float = 3.0,
+        ewma_alpha: float = 0.3,
+        rate_window: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("Expected 1 <= min_limit <= initial_limit <= max_limit")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.baseline_quantile = baseline_quantile
+        self.congestion_epochs = congestion_epochs
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.ewma_alpha = ewma_alpha
+        self.rate_window = rate_window
+        self.clock = clock
+
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+        # наблюдения
+        self._sec_per_char: Optional[float] = None  # EWMA под текущей нагрузкой
+        self._costs = deque(maxlen=baseline_window)  # секунд на токен по эпохам
+        self._last_latency: Optional[float] = None
+        self._last_tps: Optional[float] = None
+        self._completions = deque()  # (время завершения, токены)
+        self._slow_epochs = 0  # эпох подряд с задержкой выше baseline * tolerance
+
+        # эпохи, по которым ещё есть незавершённые запросы
+        self._epochs: Dict[int, _Epoch] = {}
+        self._epoch_id = -1
+
+        self.requests_total = 0
+        self.failures_total = 0
+
+    # -----------------------------------------------------
+    # slots
+    # -----------------------------------------------------
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @contextmanager
+    def slot(self):
+        """
+        Ждёт свободный слот. Возвращает номер эпохи — его нужно передать в record().
+        """
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+
+            epoch = self._epochs.get(self._epoch_id)
+            if epoch is None or epoch.dispatched >= epoch.size:
+                self._epoch_id += 1
+                epoch = self._epochs[self._epoch_id] = _Epoch(self.limit)
+
+            epoch.dispatched += 1
+            ticket = self._epoch_id
+            self._in_flight += 1
+            epoch.peak = max(epoch.peak, self._in_flight)
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    # -----------------------------------------------------
+    # timeouts
+    # -----------------------------------------------------
+
+    def timeout_for(self, input_chars: int) -> float:
+        with self._cond:
+            spc = self._sec_per_char
+        if spc is None:
+            return self.max_timeout
+        timeout = self.timeout_factor * spc * max(input_chars, 1)
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    # -----------------------------------------------------
+    # feedback
+    # -----------------------------------------------------
+
+    def record(
+        self,
+        latency: float,
+        input_chars: int,
+        tokens: int = 0,
+        ok: bool = True,
+        ticket: Optional[int] = None,
+        output_tokens: int = 0,
+    ) -> None:
+        """
+        tokens — все токены запроса (для пропускной способности),
+        output_tokens — сгенерированные (для оценки перегрузки: время ответа определяет
+        в основном генерация, префилл на порядок дешевле на токен).
+        """
+        with self._cond:
+            self.requests_total += 1
+            spc = latency / max(input_chars, 1)
+
+            if not ok:
+                self.failures_total += 1
+                # узел замедлился (или перегружен) — расширяем оценку, а не держим старую
+                if self._sec_per_char is None:
+                    self._sec_per_char = spc
+                else:
+                    self._sec_per_char = max(self._sec_per_char * 2, spc)
+            else:
+                self._last_latency = latency
+                if latency > 0:
+                    self._last_tps = tokens / latency
+                a = self.ewma_alpha
+                self._sec_per_char = spc if self._sec_per_char is None else a * spc + (1 - a) * self._sec_per_char
+                now = self.clock()
+                self._completions.append((now, tokens))
+                while self._completions and self._completions[0][0] < now - self.rate_window:
+                    self._completions.popleft()
+
+            epoch = self._epochs.get(self._epoch_id if ticket is None else ticket)
+            if epoch is not None:
+                epoch.done += 1
+                if ok:
+                    epoch.ok += 1
+                    epoch.latency_sum += latency
+                    # нормируем на сгенерированные токены; если Ollama их не вернула —
+                    # на все токены, иначе на символы входа
+                    epoch.work += output_tokens or tokens or max(input_chars, 1)
+                else:
+                    epoch.failed = True
+
+                if epoch.done >= epoch.size and epoch.dispatched >= epoch.size:
+                    self._end_epoch(epoch)
+                    self._epochs = {k: v for k, v in self._epochs.items() if v is not epoch}
+
+            self._cond.notify_all()
+
+    def _end_epoch(self, epoch: _Epoch) -> None:
+        congested = epoch.failed
+        slow = False
+        if epoch.ok:
+            cost = epoch.latency_sum / epoch.work
+            baseline = self.baseline
+            slow = baseline is not None and cost > baseline * self.latency_tolerance
+            self._slow_epochs = self._slow_epochs + 1 if slow else 0
+            if self._slow_epochs >= self.congestion_epochs:
+                congested = True
+            # медленные эпохи в базу не берём, иначе она ползёт вверх вслед за перегрузкой;
+            # на min_limit ниже некуда — значит, узел действительно стал медленнее
+            if not slow or self.limit <= self.min_limit:
+                self._costs.append(cost)
+
+        if congested:
+            self._slow_epochs = 0
+            self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+        elif not slow and epoch.peak >= epoch.size:
+            # медленная эпоха, которой ещё не хватает для снижения, — лимит держим
+            self._limit = min(self.max_limit, self._limit + 1)
+
+    @property
+    def baseline(self) -> Optional[float]:
+        if not self._costs:
+            return None
+        costs = sorted(self._costs)
+        return costs[int(self.baseline_quantile * (len(costs) - 1))]
+
+    def throughput(self) -> Optional[float]:
+        """
+        Токенов/сек по завершениям внутри окна (токены первого завершения не считаем —
+        это начало интервала).
+        """
+        if len(self._completions) < 2:
+            return None
+        span = self._completions[-1][0] - self._completions[0][0]
+        if span <= 0:
+            return None
+        return sum(t for _, t in list(self._completions)[1:]) / span
+
+    # -----------------------------------------------------
+    # metrics
+    # -----------------------------------------------------
+
+    def metrics(self) -> dict:
+        with self._cond:
+            spc = self._sec_per_char
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "throughput_tps": self.throughput(),
+                "last_request_tps": self._last_tps,
+                "last_latency_s": self._last_latency,
+                "baseline_s_per_token": self.baseline,
+                "sec_per_char": spc,
+                "timeout_per_1k_chars_s": None if spc is None else min(
+                    self.max_timeout, max(self.min_timeout, self.timeout_factor * spc * 1000)
+                ),
+                "requests_total": self.requests_total,
+                "failures_total": self.failures_total,
+            }
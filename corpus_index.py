@@ -0,0 +1,499 @@
+import os
+import sys
+import glob
+import json
+import bisect
+import sqlite3
+import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+SCHEMA_SQL = """
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS books (
+    id          INTEGER PRIMARY KEY,
+    source      TEXT NOT NULL UNIQUE,
+    title       TEXT,
+    size        INTEGER,
+    mtime       REAL,
+    dedoc_mtime REAL,
+    indexed_at  TEXT NOT NULL
+);
+
+-- JSON, которые не являются документами (манифесты, кеши, сырой вывод LLM):
+-- запоминаем size/mtime, чтобы не разбирать их заново при каждом прогоне
+CREATE TABLE IF NOT EXISTS skipped_files (
+    source  TEXT PRIMARY KEY,
+    size    INTEGER NOT NULL,
+    mtime   REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS chapters (
+    id          INTEGER PRIMARY KEY,
+    book_id     INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    idx         INTEGER NOT NULL,
+    title       TEXT,
+    page_start  INTEGER,
+    page_end    INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS paragraphs (
+    id          INTEGER PRIMARY KEY,
+    chapter_id  INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+    idx         INTEGER NOT NULL,
+    title       TEXT,
+    page_start  INTEGER,
+    page_end    INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS sections (
+    id            INTEGER PRIMARY KEY,
+    paragraph_id  INTEGER NOT NULL REFERENCES paragraphs(id) ON DELETE CASCADE,
+    idx           INTEGER NOT NULL,
+    title         TEXT,
+    section_type  TEXT,
+    text          TEXT,
+    page_start    INTEGER,
+    page_end      INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS chapters_book ON chapters(book_id, idx);
+CREATE INDEX IF NOT EXISTS paragraphs_chapter ON paragraphs(chapter_id, idx);
+CREATE INDEX IF NOT EXISTS sections_paragraph ON sections(paragraph_id, idx);
+
+-- полнотекстовый индекс по секциям (external content → без дублирования текста)
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(
+    title, text,
+    content='sections', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS sections_ai AFTER INSERT ON sections BEGIN
+    INSERT INTO sections_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS sections_ad AFTER DELETE ON sections BEGIN
+    INSERT INTO sections_fts(sections_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+END;
+
+-- заголовки глав и параграфов (external content, как sections_fts;
+-- удаление книги каскадом чистит titles, а триггер — индекс)
+CREATE TABLE IF NOT EXISTS titles (
+    id       INTEGER PRIMARY KEY,
+    book_id  INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    kind     TEXT NOT NULL,
+    ref_id   INTEGER NOT NULL,
+    title    TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS titles_book ON titles(book_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS titles_fts USING fts5(
+    title,
+    content='titles', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS titles_ai AFTER INSERT ON titles BEGIN
+    INSERT INTO titles_fts(rowid, title) VALUES (new.id, new.title);
+END;
+
+CREATE TRIGGER IF NOT EXISTS titles_ad AFTER DELETE ON titles BEGIN
+    INSERT INTO titles_fts(titles_fts, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+"""
+
+
+def page_range(node: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Явные ссылки на страницы, если узел их содержит: page / page_start / page_end.
+    В schemas/schema.json таких полей нет, поэтому обычно страницы берутся из PageLocator.
+    """
+    start = node.get("page_start", node.get("page"))
+    end = node.get("page_end", start)
+    return start, end
+
+
+def letters_only(text: str) -> str:
+    # после LLM-очистки переносы, пробелы, пунктуация и номера страниц могут отличаться
+    # от OCR — сравниваем только буквы
+    return "".join(ch for ch in text.lower() if ch.isalpha())
+
+
+class PageLocator:
+    """
+    Страницы секций по dedoc-json той же книги: текст секции ищется (по буквам)
+    в тексте OCR, где известен metadata.page_id каждой строки. Номера страниц 1-based.
+    Поиск идёт вперёд от предыдущей найденной секции, чтобы повторы не сбивали порядок.
+    """
+
+    PROBE = 40
+
+    def __init__(self, dedoc_json: Dict[str, Any]):
+        parts: List[str] = []
+        self.offsets: List[int] = []
+        self.pages: List[int] = []
+        size = 0
+
+        def walk(node: Dict[str, Any]):
+            nonlocal size
+            text = letters_only(node.get("text") or "")
+            if text:
+                self.offsets.append(size)
+                self.pages.append(((node.get("metadata") or {}).get("page_id") or 0) + 1)
+                parts.append(text)
+                size += len(text)
+            for ch in node.get("subparagraphs", []) or []:
+                walk(ch)
+
+        structure = dedoc_json.get("content", {}).get("structure")
+        if isinstance(structure, dict):
+            walk(structure)
+
+        self.text = "".join(parts)
+        self.cursor = 0
+
+    def _page_at(self, pos: int) -> int:
+        return self.pages[bisect.bisect_right(self.offsets, pos) - 1]
+
+    def locate(self, text: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+        norm = letters_only(text or "")
+        if len(norm) < 8 or not self.text:
+            return None, None
+
+        head = norm[:self.PROBE]
+        start = self.text.find(head, self.cursor)
+        if start < 0:
+            start = self.text.find(head)
+        if start < 0:
+            return None, None
+
+        tail = norm[-self.PROBE:]
+        end = self.text.find(tail, start)
+        end = end + len(tail) - 1 if end >= 0 else min(start + len(norm), len(self.text)) - 1
+
+        self.cursor = start + 1
+        return self._page_at(start), self._page_at(end)
+
+
+def find_dedoc_path(path: str) -> Optional[str]:
+    """
+    dedoc-json рядом со структурированным JSON: <имя>.<язык>.dedoc.json или <имя>.dedoc.json
+    (самый свежий, если их несколько).
+    """
+    base, _ = os.path.splitext(path)
+    candidates = glob.glob(glob.escape(base) + ".*dedoc.json")
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def find_dedoc_json(path: str) -> Optional[Dict[str, Any]]:
+    dedoc_path = find_dedoc_path(path)
+    if dedoc_path is None:
+        return None
+    try:
+        with open(dedoc_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+def merge_ranges(ranges: List[Tuple[Optional[int], Optional[int]]]) -> Tuple[Optional[int], Optional[int]]:
+    starts = [r[0] for r in ranges if r[0] is not None]
+    ends = [r[1] for r in ranges if r[1] is not None]
+    return (min(starts) if starts else None), (max(ends) if ends else None)
+
+
+def load_document(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Структурированный документ: {"type": "document", ...} или список глав (сырой вывод LLM).
+    Остальные JSON (dedoc-json, кеши) пропускаются.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+    if isinstance(data, dict) and data.get("type") == "document":
+        return data
+    if isinstance(data, list) and data and all(
+        isinstance(ch, dict) and ch.get("type") == "chapter" for ch in data
+    ):
+        return {"type": "document", "children": data}
+    return None
+
+
+class CorpusIndex:
+    """
+    SQLite-индекс корпуса: book → chapter → paragraph → section + FTS5 по тексту и заголовкам.
+    Книга переиндексируется только если её JSON (size/mtime) или dedoc-json рядом (mtime) изменились.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        try:
+            self.conn.executescript(SCHEMA_SQL)
+        except sqlite3.OperationalError as e:
+            if "fts5" in str(e).lower():
+                raise RuntimeError("SQLite build without FTS5 support") from e
+            raise
+        self._migrate()
+
+    def _migrate(self) -> None:
+        # базы, созданные до появления books.dedoc_mtime
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(books)")}
+        if "dedoc_mtime" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE books ADD COLUMN dedoc_mtime REAL")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -----------------------------------------------------
+    # write
+    # -----------------------------------------------------
+
+    def is_up_to_date(self, source: str, dedoc_mtime: Optional[float] = None) -> bool:
+        """
+        Книга уже проиндексирована с этим JSON и этим dedoc-json (страницы берутся из него)
+        или файл уже признан не-документом.
+        """
+        st = os.stat(source)
+        source = os.path.abspath(source)
+
+        row = self.conn.execute(
+            "SELECT size, mtime, dedoc_mtime FROM books WHERE source = ?", (source,)
+        ).fetchone()
+        if row is not None:
+            return row["size"] == st.st_size and row["mtime"] == st.st_mtime and row["dedoc_mtime"] == dedoc_mtime
+
+        row = self.conn.execute(
+            "SELECT size, mtime FROM skipped_files WHERE source = ?", (source,)
+        ).fetchone()
+        return row is not None and row["size"] == st.st_size and row["mtime"] == st.st_mtime
+
+    def _mark_skipped(self, source: str) -> None:
+        st = os.stat(source)
+        source = os.path.abspath(source)
+        with self.conn:
+            # файл мог раньше быть книгой
+            self._remove_book(source)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO skipped_files(source, size, mtime) VALUES (?, ?, ?)",
+                (source, st.st_size, st.st_mtime),
+            )
+
+    def remove_book(self, source: str) -> None:
+        with self.conn:
+            self._remove_book(os.path.abspath(source))
+
+    def _remove_book(self, source: str) -> None:
+        # главы, параграфы, секции, заголовки и оба FTS-индекса чистятся каскадом/триггерами
+        self.conn.execute("DELETE FROM books WHERE source = ?", (source,))
+        self.conn.execute("DELETE FROM skipped_files WHERE source = ?", (source,))
+
+    def add_book(
+        self,
+        source: str,
+        document: Dict[str, Any],
+        title: Optional[str] = None,
+        dedoc_json: Optional[Dict[str, Any]] = None,
+        dedoc_mtime: Optional[float] = None,
+    ) -> int:
+        """
+        Добавляет (или заменяет) одну книгу. Вызывается по мере готовности книг.
+        Если передан dedoc_json этой книги — страницы секций определяются по нему,
+        иначе page_start/page_end заполняются только из явных полей узлов (обычно NULL).
+        dedoc_mtime — mtime файла dedoc_json, для проверки свежести в is_up_to_date.
+        """
+        source = os.path.abspath(source)
+        size = mtime = None
+        if os.path.exists(source):
+            st = os.stat(source)
+            size, mtime = st.st_size, st.st_mtime
+
+        if title is None:
+            title = document.get("title") or os.path.splitext(os.path.basename(source))[0]
+
+        with self.conn:
+            self._remove_book(source)
+
+            book_id = self.conn.execute(
+                "INSERT INTO books(source, title, size, mtime, dedoc_mtime, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (source, title, size, mtime, dedoc_mtime, datetime.datetime.now().isoformat(timespec="seconds")),
+            ).lastrowid
+
+            pages = self._page_ranges(document, PageLocator(dedoc_json) if dedoc_json else None)
+
+            for ci, chapter in enumerate(document.get("children", [])):
+                chapter_id = self.conn.execute(
+                    "INSERT INTO chapters(book_id, idx, title, page_start, page_end) VALUES (?, ?, ?, ?, ?)",
+                    (book_id, ci, chapter.get("title"), *pages[id(chapter)]),
+                ).lastrowid
+                self._add_title("chapter", chapter_id, book_id, chapter.get("title"))
+
+                for pi, paragraph in enumerate(chapter.get("children", [])):
+                    paragraph_id = self.conn.execute(
+                        "INSERT INTO paragraphs(chapter_id, idx, title, page_start, page_end) VALUES (?, ?, ?, ?, ?)",
+                        (chapter_id, pi, paragraph.get("title"), *pages[id(paragraph)]),
+                    ).lastrowid
+                    self._add_title("paragraph", paragraph_id, book_id, paragraph.get("title"))
+
+                    self.conn.executemany(
+                        "INSERT INTO sections(paragraph_id, idx, title, section_type, text, page_start, page_end)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (
+                                paragraph_id, si, section.get("title"), section.get("section_type"),
+                                section.get("text"), *pages[id(section)],
+                            )
+                            for si, section in enumerate(paragraph.get("children", []))
+                        ],
+                    )
+
+        return book_id
+
+    @staticmethod
+    def _page_ranges(document: Dict[str, Any], locator: Optional[PageLocator]) -> Dict[int, tuple]:
+        """
+        id(узла) → (page_start, page_end). Явные поля узла важнее найденных по dedoc-json;
+        диапазон главы/параграфа — объединение диапазонов вложенных узлов.
+        """
+        pages: Dict[int, tuple] = {}
+
+        def explicit_or(node: Dict[str, Any], found: tuple) -> tuple:
+            start, end = page_range(node)
+            return (start, end) if start is not None else found
+
+        for chapter in document.get("children", []):
+            paragraph_ranges = []
+            for paragraph in chapter.get("children", []):
+                section_ranges = []
+                for section in paragraph.get("children", []):
+                    found = locator.locate(section.get("text")) if locator else (None, None)
+                    pages[id(section)] = explicit_or(section, found)
+                    section_ranges.append(pages[id(section)])
+                pages[id(paragraph)] = explicit_or(paragraph, merge_ranges(section_ranges))
+                paragraph_ranges.append(pages[id(paragraph)])
+            pages[id(chapter)] = explicit_or(chapter, merge_ranges(paragraph_ranges))
+
+        return pages
+
+    def _add_title(self, kind: str, ref_id: int, book_id: int, title: Optional[str]) -> None:
+        if title:
+            self.conn.execute(
+                "INSERT INTO titles(book_id, kind, ref_id, title) VALUES (?, ?, ?, ?)",
+                (book_id, kind, ref_id, title),
+            )
+
+    def index_file(self, path: str) -> bool:
+        dedoc_path = find_dedoc_path(path)
+        dedoc_mtime = os.path.getmtime(dedoc_path) if dedoc_path else None
+        if self.is_up_to_date(path, dedoc_mtime):
+            return False
+
+        document = load_document(path)
+        if document is None:
+            self._mark_skipped(path)
+            return False
+
+        dedoc_json = find_dedoc_json(path) if dedoc_path else None
+        self.add_book(path, document, dedoc_json=dedoc_json, dedoc_mtime=dedoc_mtime)
+        return True
+
+    def index_directory(self, root_dir: str) -> int:
+        """
+        Инкрементальная индексация: новые и изменённые JSON, удалённые книги убираются.
+        """
+        updated = 0
+        seen = set()
+
+        for dirpath, _, filenames in os.walk(root_dir):
+            for name in filenames:
+                lower = name.lower()
+                # служебные файлы прогона (.run_manifest.json и т.п.) и dedoc-json — не документы
+                if not lower.endswith(".json") or lower.endswith(".dedoc.json") or name.startswith("."):
+                    continue
+                path = os.path.join(dirpath, name)
+                seen.add(os.path.abspath(path))
+                try:
+                    if self.index_file(path):
+                        updated += 1
+                        print(datetime.datetime.now(), f"[INDEX] {path}")
+                except Exception as e:
+                    print(datetime.datetime.now(), f"[ERR] Index failed: {path}\n    {type(e).__name__}: {e}")
+
+        root = os.path.abspath(root_dir)
+        rows = self.conn.execute("SELECT source FROM books UNION SELECT source FROM skipped_files").fetchall()
+        for row in rows:
+            source = row["source"]
+            if source.startswith(root + os.sep) and source not in seen:
+                self.remove_book(source)
+
+        return updated
+
+    # -----------------------------------------------------
+    # query
+    # -----------------------------------------------------
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Полнотекстовый поиск по секциям (синтаксис FTS5 MATCH).
+        """
+        rows = self.conn.execute(
+            """
+            SELECT b.title AS book, b.source, c.title AS chapter, p.title AS paragraph,
+                   s.id AS section_id, s.title, s.section_type, s.page_start, s.page_end,
+                   snippet(sections_fts, 1, '[', ']', '…', 12) AS snippet
+            FROM sections_fts
+            JOIN sections s ON s.id = sections_fts.rowid
+            JOIN paragraphs p ON p.id = s.paragraph_id
+            JOIN chapters c ON c.id = p.chapter_id
+            JOIN books b ON b.id = c.book_id
+            WHERE sections_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (query, limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def search_titles(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            """
+            SELECT t.kind, t.ref_id, t.title, b.title AS book, b.source
+            FROM titles_fts
+            JOIN titles t ON t.id = titles_fts.rowid
+            JOIN books b ON b.id = t.book_id
+            WHERE titles_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (query, limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def iter_books(self) -> Iterator[Dict[str, Any]]:
+        for row in self.conn.execute("SELECT id, source, title, indexed_at FROM books ORDER BY id"):
+            yield dict(row)
+
+
+if __name__ == "__main__":
+    # python corpus_index.py <папка с JSON> <corpus.sqlite> [запрос]
+    root, db = sys.argv[1], sys.argv[2]
+    with CorpusIndex(db) as index:
+        print(f"Updated books: {index.index_directory(root)}")
+        if len(sys.argv) > 3:
+            for hit in index.search(sys.argv[3]):
+                print(f"{hit['book']} / {hit['chapter']} / {hit['paragraph']}: {hit['snippet']}")
@@ -0,0 +1,163 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+OCR_PARAMS = {
+    "pdf_with_text_layer": "false",            # ВАЖНО: принудительно OCR
+    "need_pdf_table_analysis": "false",
+    "need_header_footer_analysis": "false",
+    "need_binarization": "false",
+    "need_gost_frame_analysis": "false",
+}
+
+
+def sidecar_path(pdf_path: str, language: str) -> str:
+    """
+    Язык OCR входит в имя: результат, распознанный как "rus", не подменит "eng".
+    """
+    base, _ = os.path.splitext(pdf_path)
+    return f"{base}.{language}.dedoc.json"
+
+
+class DedocService:
+    """
+    Долгоживущая обёртка над DedocManager.
+
+    - DedocManager создаётся один раз на процесс (модели OCR грузятся один раз)
+    - результат разбора кешируется в памяти (LRU) и, опционально, в <имя>.<язык>.dedoc.json рядом с PDF,
+      чтобы один проход OCR кормил и извлечение текста, и parse_toc, и структурирование
+    """
+
+    def __init__(self, use_sidecar: bool = True, memory_cache_size: int = 8):
+        self.use_sidecar = use_sidecar
+        self.memory_cache_size = memory_cache_size
+        self._manager = None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple, dict]" = OrderedDict()
+
+    @property
+    def manager(self):
+        if self._manager is None:
+            with self._lock:
+                if self._manager is None:
+                    from dedoc import DedocManager
+                    self._manager = DedocManager()
+        return self._manager
+
+    def warm_up(self) -> None:
+        _ = self.manager
+
+    # -----------------------------------------------------
+    # cache
+    # -----------------------------------------------------
+
+    @staticmethod
+    def _cache_key(pdf_path: str, language: str) -> Tuple:
+        st = os.stat(pdf_path)
+        return os.path.abspath(pdf_path), st.st_size, st.st_mtime, language
+
+    def _remember(self, key: Tuple, dedoc_json: dict) -> None:
+        if self.memory_cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = dedoc_json
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.memory_cache_size:
+                self._cache.popitem(last=False)
+
+    def _load_sidecar(self, pdf_path: str, language: str) -> Optional[dict]:
+        path = sidecar_path(pdf_path, language)
+        if not os.path.exists(path):
+            return None
+        # sidecar старее PDF — PDF поменялся, кеш невалиден
+        if os.path.getmtime(path) < os.path.getmtime(pdf_path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def save_sidecar(pdf_path: str, language: str, dedoc_json: dict) -> None:
+        with open(sidecar_path(pdf_path, language), "w", encoding="utf-8") as f:
+            json.dump(dedoc_json, f, ensure_ascii=False, indent=2)
+
+    # -----------------------------------------------------
+    # parse
+    # -----------------------------------------------------
+
+    def parse(self, pdf_path: str, language: str, params: Optional[Dict[str, str]] = None) -> dict:
+        """
+        OCR-разбор PDF. Повторный вызов для того же файла берёт результат из кеша.
+        Кеш (память и sidecar) — только для полного разбора (без доп. params, например pages).
+        """
+        # частичные разборы (pages=...) не кешируем: они мелкие, одноразовые
+        # и вытесняли бы из LRU полные результаты
+        partial = bool(params)
+
+        if not partial:
+            cached = self.lookup(pdf_path, language)
+            if cached is not None:
+                return cached
+
+        parameters = dict(OCR_PARAMS)
+        parameters.update(params or {})
+        parameters["language"] = language
+
+        result = self.manager.parse(file_path=pdf_path, parameters=parameters)
+        dedoc_json = result.to_api_schema().model_dump()
+
+        if not partial:
+            self.store(pdf_path, language, dedoc_json)
+
+        return dedoc_json
+
+    def lookup(self, pdf_path: str, language: str) -> Optional[dict]:
+        """
+        Полный результат из памяти или sidecar, без запуска OCR.
+        """
+        key = self._cache_key(pdf_path, language)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        if self.use_sidecar:
+            cached = self._load_sidecar(pdf_path, language)
+            if cached is not None:
+                self._remember(key, cached)
+                return cached
+
+        return None
+
+    def store(self, pdf_path: str, language: str, dedoc_json: dict) -> None:
+        """
+        Регистрирует полный результат, полученный в обход parse (например, собранный
+        из диапазонов страниц), чтобы parse_toc и структурирование не запускали OCR заново.
+        """
+        self._remember(self._cache_key(pdf_path, language), dedoc_json)
+        if self.use_sidecar:
+            self.save_sidecar(pdf_path, language, dedoc_json)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+_default_service: Optional[DedocService] = None
+
+
+def get_dedoc_service() -> DedocService:
+    """
+    Общий на процесс экземпляр DedocService.
+    """
+    global _default_service
+    if _default_service is None:
+        _default_service = DedocService()
+    return _default_service
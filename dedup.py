@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+import sqlite3
+import hashlib
+import threading
+from typing import Container, Dict, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+
+HASH_CHUNK = 1024 * 1024
+
+
+# =========================================================
+# FILE LEVEL
+# =========================================================
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """
+    Жёсткая ссылка на уже готовый результат; если ФС не умеет (другой диск, GDrive) — копия.
+    """
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class FileDedup:
+    """
+    content-hash PDF → путь к уже полученному txt.
+    """
+
+    def __init__(self):
+        self._outputs: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, pdf_path: str) -> Tuple[str, Optional[str]]:
+        digest = file_sha256(pdf_path)
+        with self._lock:
+            return digest, self._outputs.get(digest)
+
+    def remember(self, digest: str, txt_path: str) -> None:
+        with self._lock:
+            self._outputs.setdefault(digest, txt_path)
+
+
+# =========================================================
+# PAGE LEVEL
+# =========================================================
+
+def _hash_image_xobjects(resources, h, seen: set) -> int:
+    """
+    Добавляет в h сырые (закодированные) байты всех изображений из /Resources /XObject,
+    включая вложенные Form XObject. Возвращает число изображений.
+    Изображения не декодируем: это медленно и для JBIG2/CCITT требует внешних декодеров.
+    """
+    if resources is None:
+        return 0
+    resources = resources.get_object()
+    xobjects = resources.get("/XObject")
+    if xobjects is None:
+        return 0
+
+    count = 0
+    xobjects = xobjects.get_object()
+    for name in sorted(xobjects):
+        ref = xobjects.raw_get(name)
+        key = getattr(ref, "idnum", None), getattr(ref, "generation", None)
+        if key[0] is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+
+        obj = xobjects[name].get_object()
+        subtype = obj.get("/Subtype")
+        if subtype == "/Image":
+            h.update(obj._data)
+            count += 1
+        elif subtype == "/Form":
+            count += _hash_image_xobjects(obj.get("/Resources"), h, seen)
+
+    return count
+
+
+def page_hashes(pdf_path: str) -> List[Optional[str]]:
+    """
+    Хеш каждой страницы по сырым байтам её изображений (для сканов это и есть страница).
+    Страница без изображений (или с нечитаемыми ресурсами) получает None: её нельзя
+    надёжно отличить от других (content stream у сканов одинаковый), поэтому она
+    всегда распознаётся заново и в кеш не попадает.
+    """
+    reader = PdfReader(pdf_path)
+    hashes: List[Optional[str]] = []
+
+    for page in reader.pages:
+        h = hashlib.sha256()
+        try:
+            count = _hash_image_xobjects(page.get("/Resources"), h, set())
+        except Exception:
+            count = 0
+        hashes.append(h.hexdigest() if count else None)
+
+    return hashes
+
+
+def missing_page_ranges(hashes: List[Optional[str]], known: Container[str]) -> List[Tuple[int, int]]:
+    """
+    Непрерывные диапазоны (0-based, включительно) страниц, которых нет в кеше.
+    Страницы без хеша (None) в кеше не бывают никогда.
+    """
+    ranges: List[Tuple[int, int]] = []
+    start = None
+
+    for i, digest in enumerate(hashes):
+        if digest is None or digest not in known:
+            if start is None:
+                start = i
+        elif start is not None:
+            ranges.append((start, i - 1))
+            start = None
+
+    if start is not None:
+        ranges.append((start, len(hashes) - 1))
+
+    return ranges
+
+
+class PageTextCache:
+    """
+    hash страницы → строки текста после OCR.
+    Хранится в SQLite: запись по ключу, в памяти ничего не держим,
+    save() только фиксирует транзакцию, а не переписывает файл целиком.
+    Без path — база в памяти (на один прогон).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pages (hash TEXT PRIMARY KEY, lines TEXT NOT NULL)")
+        self.conn.commit()
+
+    def __contains__(self, digest: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM pages WHERE hash = ?", (digest,)).fetchone()
+        return row is not None
+
+    def get(self, digest: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self.conn.execute("SELECT lines FROM pages WHERE hash = ?", (digest,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, digest: str, lines: List[str]) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages(hash, lines) VALUES (?, ?)",
+                (digest, json.dumps(lines, ensure_ascii=False)),
+            )
+
+    def save(self) -> None:
+        with self._lock:
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,84 @@
+import re
+import datetime
+from typing import Callable, List, Optional, Tuple
+
+
+CYRILLIC_RE = re.compile(r"[а-яёА-ЯЁ]")
+LATIN_RE = re.compile(r"[a-zA-Z]")
+
+# доля кириллицы среди букв
+RUS_THRESHOLD = 0.8
+ENG_THRESHOLD = 0.2
+
+# меньше букв — оценке не доверяем
+MIN_LETTERS = 50
+
+
+def script_counts(text: str) -> Tuple[int, int]:
+    return len(CYRILLIC_RE.findall(text)), len(LATIN_RE.findall(text))
+
+
+def language_from_counts(cyrillic: int, latin: int) -> Optional[str]:
+    total = cyrillic + latin
+    if total < MIN_LETTERS:
+        return None
+
+    share = cyrillic / total
+    if share >= RUS_THRESHOLD:
+        return "rus"
+    if share <= ENG_THRESHOLD:
+        return "eng"
+    return "rus+eng"
+
+
+def language_from_text(text: str) -> Optional[str]:
+    return language_from_counts(*script_counts(text))
+
+
+def sample_pages(total: int, count: int = 2) -> List[int]:
+    """
+    0-based номера страниц для пробного OCR.
+    Обложку и последние страницы (выходные данные) обходим: берём страницы на 1/3, 2/3 и т.д.
+    """
+    if total <= 0:
+        return []
+    if total <= count:
+        return list(range(total))
+    return sorted({total * (i + 1) // (count + 1) for i in range(count)})
+
+
+def choose_language_by_content(
+    total_pages: int,
+    ocr_page: Callable[[int], str],
+    fallback: str,
+    pages_to_sample: int = 2,
+) -> str:
+    """
+    Определяет язык OCR по содержимому:
+    - ocr_page(i) распознаёт страницу i (0-based) в режиме "rus+eng" и возвращает текст
+    - по каждой странице считаем кириллицу/латиницу
+    - страницы разошлись во мнении → "rus+eng"
+    - букв слишком мало → fallback (например, правило по имени файла)
+    """
+    verdicts = set()
+    cyrillic = latin = 0
+
+    for page in sample_pages(total_pages, pages_to_sample):
+        try:
+            text = ocr_page(page)
+        except Exception as e:
+            print(datetime.datetime.now(), f"[LANG] Sample OCR failed on page {page + 1}: {type(e).__name__}: {e}")
+            continue
+
+        page_cyrillic, page_latin = script_counts(text)
+        cyrillic += page_cyrillic
+        latin += page_latin
+
+        verdict = language_from_counts(page_cyrillic, page_latin)
+        if verdict is not None:
+            verdicts.add(verdict)
+
+    if len(verdicts) > 1:
+        return "rus+eng"
+
+    return language_from_counts(cyrillic, latin) or fallback
@@ -0,0 +1,297 @@
+import random
+import datetime
+import threading
+import time
+from typing import Callable, List, Optional
+
+from llm_interface import BaseLLMClient
+
+
+def log_with_time(message: str) -> None:
+    print(datetime.datetime.now(), message)
+
+
+class CircuitBreaker:
+    """
+    Простой circuit breaker:
+    - closed    — запросы идут как обычно
+    - open      — после N ошибок подряд бэкенд выключается на reset_timeout секунд
+    - half_open — по истечении таймаута пропускаем один пробный запрос
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_in(self) -> float:
+        """
+        Через сколько секунд цепь перейдёт в half_open (0 — уже можно пробовать).
+        """
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            return True
+        return False
+
+    def on_start(self) -> None:
+        if self.state == "half_open":
+            self.probing = True
+
+    def on_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def on_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            # в half_open одна ошибка снова открывает цепь
+            self.opened_at = time.monotonic()
+
+
+class Backend:
+    """
+    Обёртка над LLM-клиентом: вес, число запросов "в полёте", задержка (EWMA), circuit breaker.
+    """
+
+    def __init__(
+        self,
+        client: BaseLLMClient,
+        name: Optional[str] = None,
+        weight: float = 1.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+    ):
+        if weight <= 0:
+            raise ValueError("Backend weight must be positive")
+
+        self.client = client
+        self.name = name or type(client).__name__
+        self.weight = weight
+        self.in_flight = 0
+        self.healthy = True
+        self.latency: Optional[float] = None  # EWMA, секунды
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def available(self) -> bool:
+        return self.healthy and self.breaker.allow()
+
+    def record_latency(self, seconds: float, alpha: float = 0.3) -> None:
+        self.latency = seconds if self.latency is None else alpha * seconds + (1 - alpha) * self.latency
+
+    def score(self, default_latency: float) -> float:
+        """
+        Доля трафика: больше вес — больше, больше запросов в полёте / медленнее — меньше.
+        """
+        latency = self.latency if self.latency is not None else default_latency
+        return self.weight / ((self.in_flight + 1) * max(latency, 1e-3))
+
+
+class RouterClient(BaseLLMClient):
+    """
+    Роутер поверх нескольких LLM-клиентов (разные API или несколько инстансов Ollama).
+
+    - выбирает бэкенд случайно с вероятностью ~ weight / ((in_flight + 1) * latency),
+      так что нагрузка делится и между последовательными вызовами
+    - при ошибке автоматически переключается на следующий бэкенд
+    - если все цепи разомкнуты — ждёт (не дольше max_wait) ближайший half_open бэкенд
+    - в фоне проверяет здоровье бэкендов (если у клиента есть health_check)
+    """
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        health_check_interval: float = 30.0,
+        max_wait: float = 60.0,
+        log: Callable[[str], None] = log_with_time,
+        rng: Optional[random.Random] = None,
+    ):
+        if not backends:
+            raise ValueError("RouterClient requires at least one backend")
+
+        self.backends = backends
+        self.health_check_interval = health_check_interval
+        self.max_wait = max_wait
+        self.log = log
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._health_lock = threading.Lock()
+        self._last_health_check = 0.0
+
+    @property
+    def num_ctx(self) -> Optional[int]:
+        """
+        Наименьшее окно контекста среди бэкендов — запрос может уйти на любой.
+        """
+        windows = [getattr(b.client, "num_ctx", None) for b in self.backends]
+        windows = [w for w in windows if w]
+        return min(windows) if windows else None
+
+    # -----------------------------------------------------
+    # health checks
+    # -----------------------------------------------------
+
+    def check_health(self) -> None:
+        for backend in self.backends:
+            check = getattr(backend.client, "health_check", None)
+            if check is None:
+                continue
+            try:
+                healthy = bool(check())
+            except Exception:
+                healthy = False
+
+            if healthy != backend.healthy:
+                self.log(f"[ROUTER] {backend.name}: {'UP' if healthy else 'DOWN'}")
+            backend.healthy = healthy
+
+        self._last_health_check = time.monotonic()
+
+    def _maybe_check_health(self) -> None:
+        """
+        Проверка в фоновом потоке, не чаще раза в интервал и не более одной одновременно:
+        запрос не ждёт мёртвый хост.
+        """
+        if self.health_check_interval <= 0:
+            return
+        if time.monotonic() - self._last_health_check < self.health_check_interval:
+            return
+        if not self._health_lock.acquire(blocking=False):
+            return
+
+        self._last_health_check = time.monotonic()
+
+        def run():
+            try:
+                self.check_health()
+            finally:
+                self._health_lock.release()
+
+        threading.Thread(target=run, name="llm-router-health", daemon=True).start()
+
+    # -----------------------------------------------------
+    # routing
+    # -----------------------------------------------------
+
+    def _pick(self, candidates: List[Backend]) -> Backend:
+        known = [b.latency for b in candidates if b.latency is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        scores = [b.score(default_latency) for b in candidates]
+        return self._rng.choices(candidates, weights=scores, k=1)[0]
+
+    def _acquire(self, exclude: List[Backend]) -> Optional[Backend]:
+        with self._lock:
+            candidates = [
+                b for b in self.backends
+                if b not in exclude and b.available()
+            ]
+            if not candidates:
+                return None
+
+            backend = self._pick(candidates)
+            backend.in_flight += 1
+            backend.breaker.on_start()
+            return backend
+
+    def _wait_for_half_open(self, exclude: List[Backend]) -> Optional[Backend]:
+        """
+        Все цепи разомкнуты: ждём бэкенд с ближайшим переходом в half_open
+        (health-флаг не учитываем — лучше пробный запрос, чем отказ).
+        """
+        deadline = time.monotonic() + self.max_wait
+
+        while True:
+            with self._lock:
+                candidates = [
+                    b for b in self.backends
+                    if b not in exclude and not b.breaker.probing
+                ]
+                if candidates:
+                    backend = min(candidates, key=lambda b: b.breaker.retry_in())
+                    wait = backend.breaker.retry_in()
+                    if wait <= 0:
+                        backend.in_flight += 1
+                        backend.breaker.on_start()
+                        return backend
+                    self.log(f"[ROUTER] All backends open, waiting {wait:.1f}s for {backend.name}")
+                else:
+                    # пробный запрос уже идёт из другого потока — ждём его исхода
+                    wait = 0.5
+
+            if time.monotonic() + wait > deadline:
+                return None
+
+            time.sleep(wait)
+
+    def _release(self, backend: Backend, ok: bool, latency: Optional[float] = None) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+            if ok:
+                backend.breaker.on_success()
+                if latency is not None:
+                    backend.record_latency(latency)
+            else:
+                backend.breaker.on_failure()
+
+    def generate(self, system_prompt: str, user_text: str) -> str:
+        self._maybe_check_health()
+
+        tried: List[Backend] = []
+        last_error: Optional[Exception] = None
+
+        while True:
+            backend = self._acquire(exclude=tried)
+            if backend is None and not tried:
+                backend = self._wait_for_half_open(exclude=tried)
+            if backend is None:
+                break
+            tried.append(backend)
+
+            t0 = time.monotonic()
+            try:
+                result = backend.client.generate(system_prompt, user_text)
+            except Exception as e:
+                self._release(backend, ok=False)
+                last_error = e
+                self.log(f"[ROUTER] {backend.name} failed: {type(e).__name__}: {e}")
+                continue
+
+            self._release(backend, ok=True, latency=time.monotonic() - t0)
+            return result
+
+        if last_error is not None:
+            raise RuntimeError("All LLM backends failed") from last_error
+        raise RuntimeError("No available LLM backends")
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "weight": b.weight,
+                    "in_flight": b.in_flight,
+                    "latency": b.latency,
+                    "healthy": b.healthy,
+                    "state": b.breaker.state,
+                    "failures": b.breaker.failures,
+                }
+                for b in self.backends
+            ]
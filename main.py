@@ -1,10 +1,14 @@
 import os
-import json
 import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from pypdf import PdfReader
-from dedoc import DedocManager
+
+from dedoc_service import get_dedoc_service
+from pdf_scanner import PdfScheduler, count_pages
+from language_detect import choose_language_by_content
+from run_manifest import RunManifest
+from dedup import FileDedup, PageTextCache, link_or_copy, missing_page_ranges, page_hashes
 
 
 # =========================================================
@@ -12,12 +16,37 @@ from dedoc import DedocManager
 # =========================================================
 
 ROOT_DIR = r"C:\Users\Admin\Documents\GDrive\Мой диск\Work\Textbooks"  # папка для рекурсивного обхода
-SAVE_DEDOC_JSON = False  # True если хочешь ещё сохранять dedoc-json рядом
+SAVE_DEDOC_JSON = True  # сохранять dedoc-json рядом (он же кеш для parse_toc / структурирования)
 
 # Ограничение для быстрой проверки текстового слоя:
 # проверяем первые N страниц (обычно хватает, чтобы понять)
 TEXT_LAYER_CHECK_PAGES = 5
 
+# Один DedocManager на процесс: модели OCR грузятся один раз,
+# результат разбора переиспользуется (память + <имя>.<язык>.dedoc.json).
+# SAVE_DEDOC_JSON применяется в run_recursive, а не при импорте модуля
+DEDOC = get_dedoc_service()
+
+# Дедупликация: одинаковые PDF (по содержимому) OCR-ятся один раз,
+# одинаковые страницы (обложки, пустые, выходные данные) — тоже
+DEDUP_FILES = True
+DEDUP_PAGES = True
+PAGE_CACHE_NAME = ".page_text_cache.sqlite"  # кладётся в корень обхода
+
+# Обход папки: параллельный scandir + порядок обработки
+# политика: "smallest" | "newest" | "pages" | "none"
+SCAN_POLICY = "smallest"
+SCAN_WORKERS = 8
+SCAN_WARMUP = 60.0  # сек: сколько ждать окончания обхода перед первым OCR
+INCLUDE_GLOBS = ["*.pdf"]  # относительно ROOT_DIR или по имени файла; берутся только .pdf в любом случае
+EXCLUDE_GLOBS: List[str] = []
+
+# Язык OCR по содержимому: пробный OCR пары страниц в режиме "rus+eng",
+# подсчёт кириллицы/латиницы. Результат кешируется в манифесте прогона.
+DETECT_LANGUAGE = True
+LANGUAGE_SAMPLE_PAGES = 2
+RUN_MANIFEST_NAME = ".run_manifest.json"  # кладётся в корень обхода
+
 
 # =========================================================
 # HELPERS
@@ -31,6 +60,52 @@ def choose_language_by_filename(filename: str) -> str:
     return "rus"
 
 
+def choose_language(
+    pdf_path: str,
+    manifest: Optional[RunManifest],
+    total_pages: Optional[int] = None,
+    page_cache: Optional[PageTextCache] = None,
+    hashes: Optional[List[Optional[str]]] = None,
+) -> str:
+    """
+    Язык для OCR: из манифеста, иначе по содержимому, иначе по имени файла.
+    Пробные страницы распознаются как "rus+eng", поэтому в page_cache (hashes — из page_hashes)
+    они кладутся, только если выбран именно "rus+eng": иначе полный проход получил бы текст
+    другого режима OCR.
+    """
+    fallback = choose_language_by_filename(os.path.basename(pdf_path))
+    if not DETECT_LANGUAGE:
+        return fallback
+
+    if manifest is not None:
+        cached = manifest.get(pdf_path, "language")
+        if cached:
+            return cached
+
+    if total_pages is None:
+        total_pages = count_pages(pdf_path) or 0
+
+    sampled: Dict[int, List[str]] = {}
+
+    def ocr_page(page: int) -> str:
+        dedoc_json = DEDOC.parse(pdf_path, language="rus+eng", params={"pages": f"{page + 1}:{page + 1}"})
+        sampled[page] = extract_lines_by_page(dedoc_json).get(page, [])
+        return "\n".join(extract_plain_text_lines(dedoc_json))
+
+    language = choose_language_by_content(total_pages, ocr_page, fallback, LANGUAGE_SAMPLE_PAGES)
+
+    if page_cache is not None and hashes is not None and language == "rus+eng":
+        for page, page_lines in sampled.items():
+            if page < len(hashes) and hashes[page] is not None:
+                page_cache.put(f"{hashes[page]}:{language}", page_lines)
+
+    if manifest is not None:
+        manifest.set(pdf_path, "language", language)
+        manifest.save()
+
+    return language
+
+
 def pdf_has_text_layer(pdf_path: str, pages_to_check: int = 5) -> bool:
     """
     Быстрая проверка: есть ли в PDF извлекаемый текст.
@@ -62,19 +137,9 @@ def parse_pdf_ocr_only(pdf_path: str, language: str) -> dict:
     """
     Dedoc OCR-режим: принудительно считаем что текстового слоя нет.
     Это соответствует требованию "только сканы/изображения".
+    Повторный вызов для того же файла берёт результат из кеша DEDOC.
     """
-    manager = DedocManager()
-    params = {
-        "pdf_with_text_layer": "false",            # ВАЖНО: принудительно OCR
-        "need_pdf_table_analysis": "false",
-        "need_header_footer_analysis": "false",
-        "need_binarization": "false",
-        "need_gost_frame_analysis": "false",
-        "language": language,
-        # можно добавить pages=":" при необходимости, обычно не нужно
-    }
-    result = manager.parse(file_path=pdf_path, parameters=params)
-    return result.to_api_schema().model_dump()
+    return DEDOC.parse(pdf_path, language=language)
 
 
 def extract_plain_text_lines(dedoc_json: dict) -> List[str]:
@@ -95,6 +160,123 @@ def extract_plain_text_lines(dedoc_json: dict) -> List[str]:
     return lines
 
 
+def extract_lines_by_page(dedoc_json: dict) -> Dict[int, List[str]]:
+    """
+    Как extract_plain_text_lines, но с группировкой по metadata.page_id (0-based).
+    """
+    pages: Dict[int, List[str]] = {}
+
+    def walk(node: dict):
+        text = node.get("text")
+        if isinstance(text, str) and text.strip():
+            page_id = (node.get("metadata") or {}).get("page_id") or 0
+            pages.setdefault(page_id, []).append(text.strip())
+
+        for ch in node.get("subparagraphs", []) or []:
+            walk(ch)
+
+    structure = dedoc_json.get("content", {}).get("structure")
+    if isinstance(structure, dict):
+        walk(structure)
+
+    return pages
+
+
+def assemble_dedoc_json(
+    range_results: Dict[Tuple[int, int], dict],
+    hashes: List[Optional[str]],
+    page_cache: PageTextCache,
+) -> dict:
+    """
+    Полный dedoc-json из разборов отдельных диапазонов страниц + кешированных страниц.
+    Распознанные диапазоны вставляются как есть (с аннотациями), кешированные страницы —
+    простыми строками без аннотаций (шрифт/отступы для parse_toc по ним недоступны).
+    """
+    children: List[dict] = []
+    page = 0
+
+    while page < len(hashes):
+        rng = next(((s, e) for s, e in range_results if s == page), None)
+        if rng is not None:
+            root = range_results[rng].get("content", {}).get("structure") or {}
+            if (root.get("text") or "").strip():
+                children.append({**root, "subparagraphs": []})
+            children.extend(root.get("subparagraphs", []) or [])
+            page = rng[1] + 1
+            continue
+
+        # сюда попадают только кешированные страницы: страницы без хеша всегда в range_results
+        for line in page_cache.get(hashes[page]) or []:
+            children.append({
+                "text": line,
+                "annotations": [],
+                "metadata": {"page_id": page, "paragraph_type": "raw_text"},
+                "subparagraphs": [],
+            })
+        page += 1
+
+    return {
+        "content": {
+            "structure": {
+                "text": "",
+                "annotations": [],
+                "metadata": {"page_id": 0, "paragraph_type": "root", "assembled_from_page_cache": True},
+                "subparagraphs": children,
+            },
+        },
+    }
+
+
+def ocr_with_page_cache(
+    pdf_path: str,
+    language: str,
+    page_cache: PageTextCache,
+    hashes: Optional[List[Optional[str]]] = None,
+) -> List[str]:
+    """
+    OCR только тех страниц, чей хеш ещё не встречался; текст остальных берётся из кеша.
+    Если кешированных страниц нет — обычный полный разбор.
+    При частичном разборе собранный полный результат регистрируется в DEDOC,
+    чтобы parse_toc_from_pdf / структурирование не делали второй проход OCR.
+    """
+    full = DEDOC.lookup(pdf_path, language)
+    if full is not None:
+        return extract_plain_text_lines(full)
+
+    # страницы без хеша (нет изображений) распознаём всегда и в кеш не кладём
+    if hashes is None:
+        hashes = page_hashes(pdf_path)
+    hashes = [None if h is None else f"{h}:{language}" for h in hashes]
+    ranges = missing_page_ranges(hashes, page_cache)
+
+    if ranges == [(0, len(hashes) - 1)]:
+        dedoc_json = parse_pdf_ocr_only(pdf_path, language=language)
+        for page_id, page_lines in extract_lines_by_page(dedoc_json).items():
+            if page_id < len(hashes) and hashes[page_id] is not None:
+                page_cache.put(hashes[page_id], page_lines)
+        for h in hashes:
+            if h is not None and h not in page_cache:
+                page_cache.put(h, [])
+        return extract_plain_text_lines(dedoc_json)
+
+    range_results: Dict[Tuple[int, int], dict] = {}
+    for start, end in ranges:
+        # dedoc: pages — 1-based, включительно
+        dedoc_json = DEDOC.parse(pdf_path, language=language, params={"pages": f"{start + 1}:{end + 1}"})
+        range_results[(start, end)] = dedoc_json
+        by_page = extract_lines_by_page(dedoc_json)
+        for page_id in range(start, end + 1):
+            if hashes[page_id] is not None:
+                page_cache.put(hashes[page_id], by_page.get(page_id, []))
+
+    reused = len(hashes) - sum(end - start + 1 for start, end in ranges)
+    print(datetime.datetime.now(), f"[INFO] Reused {reused}/{len(hashes)} pages from cache: {pdf_path}")
+
+    full = assemble_dedoc_json(range_results, hashes, page_cache)
+    DEDOC.store(pdf_path, language, full)
+    return extract_plain_text_lines(full)
+
+
 def pdf_to_txt_path(pdf_path: str) -> str:
     base, _ = os.path.splitext(pdf_path)
     return base + ".txt"
@@ -106,61 +288,87 @@ def save_text(txt_path: str, lines: List[str]) -> None:
         f.write("\n".join(lines))
 
 
-def save_json_sidecar(pdf_path: str, dedoc_json: dict) -> None:
-    base, _ = os.path.splitext(pdf_path)
-    json_path = base + ".dedoc.json"
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(dedoc_json, f, ensure_ascii=False, indent=2)
-
-
 # =========================================================
 # MAIN
 # =========================================================
 
 def run_recursive(root_dir: str):
     print(datetime.datetime.now(), f"[INFO] Scan folder: {root_dir}")
+    DEDOC.use_sidecar = SAVE_DEDOC_JSON
+    DEDOC.warm_up()
 
     processed = 0
     skipped_text_layer = 0
     skipped_errors = 0
-
-    for dirpath, _, filenames in os.walk(root_dir):
-        for name in filenames:
-            if not name.lower().endswith(".pdf"):
-                continue
-
-            pdf_path = os.path.join(dirpath, name)
-
-            # 2) Только документы без текстового слоя
-            if pdf_has_text_layer(pdf_path, pages_to_check=TEXT_LAYER_CHECK_PAGES):
-                skipped_text_layer += 1
-                print(datetime.datetime.now(), f"[SKIP] Has text layer: {pdf_path}")
-                continue
-
-            lang = choose_language_by_filename(name)
-            txt_path = pdf_to_txt_path(pdf_path)
-
-            # если txt уже существует — можешь оставить/перезаписать.
-            # тут перезаписываем.
-            try:
-                print(datetime.datetime.now(), f"[INFO] OCR parse start ({lang}): {pdf_path}")
+    duplicates = 0
+
+    file_dedup = FileDedup() if DEDUP_FILES else None
+    page_cache = PageTextCache(os.path.join(root_dir, PAGE_CACHE_NAME)) if DEDUP_PAGES else None
+    manifest = RunManifest(os.path.join(root_dir, RUN_MANIFEST_NAME))
+
+    scheduler = PdfScheduler(
+        root_dir,
+        policy=SCAN_POLICY,
+        include=INCLUDE_GLOBS,
+        exclude=EXCLUDE_GLOBS,
+        workers=SCAN_WORKERS,
+        warmup=SCAN_WARMUP,
+    )
+
+    for pdf_file in scheduler:
+        pdf_path = pdf_file.path
+
+        # 2) Только документы без текстового слоя
+        if pdf_has_text_layer(pdf_path, pages_to_check=TEXT_LAYER_CHECK_PAGES):
+            skipped_text_layer += 1
+            print(datetime.datetime.now(), f"[SKIP] Has text layer: {pdf_path}")
+            continue
+
+        txt_path = pdf_to_txt_path(pdf_path)
+
+        # если txt уже существует — можешь оставить/перезаписать.
+        # тут перезаписываем.
+        try:
+            digest = None
+            if file_dedup is not None:
+                digest, done_txt = file_dedup.lookup(pdf_path)
+                if done_txt is not None:
+                    link_or_copy(done_txt, txt_path)
+                    duplicates += 1
+                    print(datetime.datetime.now(), f"[DUP] Same as {done_txt}: {pdf_path}")
+                    continue
+
+            # хеши страниц считаем один раз на книгу: нужны и пробному OCR, и полному
+            hashes = page_hashes(pdf_path) if page_cache is not None else None
+            total_pages = len(hashes) if hashes is not None else pdf_file.pages
+
+            lang = choose_language(pdf_path, manifest, total_pages, page_cache, hashes)
+            print(datetime.datetime.now(), f"[INFO] OCR parse start ({lang}): {pdf_path}")
+            if page_cache is not None:
+                lines = ocr_with_page_cache(pdf_path, lang, page_cache, hashes)
+                page_cache.save()
+            else:
                 dedoc_json = parse_pdf_ocr_only(pdf_path, language=lang)
                 lines = extract_plain_text_lines(dedoc_json)
-                save_text(txt_path, lines)
+            save_text(txt_path, lines)
+
+            if digest is not None:
+                file_dedup.remember(digest, txt_path)
 
-                if SAVE_DEDOC_JSON:
-                    save_json_sidecar(pdf_path, dedoc_json)
+            processed += 1
+            print(datetime.datetime.now(), f"[OK] Saved: {txt_path} (blocks={len(lines)})")
 
-                processed += 1
-                print(datetime.datetime.now(), f"[OK] Saved: {txt_path} (blocks={len(lines)})")
+        except Exception as e:
+            skipped_errors += 1
+            print(datetime.datetime.now(), f"[ERR] Failed: {pdf_path}\n    {type(e).__name__}: {e}")
 
-            except Exception as e:
-                skipped_errors += 1
-                print(datetime.datetime.now(), f"[ERR] Failed: {pdf_path}\n    {type(e).__name__}: {e}")
+    if page_cache is not None:
+        page_cache.close()
 
     print()
     print(datetime.datetime.now(), "[DONE]")
     print(f"Processed OCR PDFs: {processed}")
+    print(f"Duplicates (linked/copied): {duplicates}")
     print(f"Skipped (has text layer): {skipped_text_layer}")
     print(f"Skipped (errors): {skipped_errors}")
 
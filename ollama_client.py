@@ -1,10 +1,29 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
 import requests
 
+from adaptive_concurrency import AdaptiveConcurrency
+from llm_interface import BaseLLMClient
+
 
-class OllamaClient:
-    def __init__(self, model: str = "gpt-oss:20b"):
+class OllamaClient(BaseLLMClient):
+    def __init__(
+        self,
+        model: str = "gpt-oss:20b",
+        host: str = "http://localhost:11434",
+        controller: Optional[AdaptiveConcurrency] = None,
+        num_ctx: int = 8192,
+    ):
         self.model = model
-        self.url = "http://localhost:11434/api/chat"
+        # окно контекста передаём явно: иначе Ollama берёт своё умолчание (2048/4096)
+        # и молча обрезает начало длинного промпта
+        self.num_ctx = num_ctx
+        self.host = host.rstrip("/")
+        self.url = f"{self.host}/api/chat"
+        # число параллельных запросов и таймауты подбираются по факту (AIMD)
+        self.controller = controller or AdaptiveConcurrency()
 
     def generate(self, system_prompt: str, user_text: str) -> str:
         payload = {
@@ -24,18 +43,60 @@ class OllamaClient:
             "format": "json",
             "options": {
                 "temperature": 0.0,
-                "top_p": 0.9
+                "top_p": 0.9,
+                "num_ctx": self.num_ctx
             }
         }
 
-        response = requests.post(
-            self.url,
-            json=payload,
-            timeout=60 * 20
-        )
-        response.raise_for_status()
+        input_chars = len(system_prompt) + len(user_text)
 
-        data = response.json()
+        with self.controller.slot() as ticket:
+            t0 = time.monotonic()
+            try:
+                response = requests.post(
+                    self.url,
+                    json=payload,
+                    timeout=self.controller.timeout_for(input_chars)
+                )
+                response.raise_for_status()
+                data = response.json()
+            except Exception:
+                self.controller.record(time.monotonic() - t0, input_chars, ok=False, ticket=ticket)
+                raise
+
+            # prompt + сгенерированные токены — для оценки пропускной способности,
+            # сгенерированные — для оценки перегрузки
+            output_tokens = data.get("eval_count") or 0
+            tokens = (data.get("prompt_eval_count") or 0) + output_tokens
+            self.controller.record(
+                time.monotonic() - t0, input_chars, tokens=tokens, ticket=ticket, output_tokens=output_tokens
+            )
 
         # Ollama chat возвращает message → content
         return data["message"]["content"]
+
+    @property
+    def max_parallel(self) -> int:
+        return self.controller.max_limit
+
+    def generate_many(self, requests_list: List[Tuple[str, str]]) -> List[str]:
+        """
+        Параллельная генерация для списка (system_prompt, user_text).
+        Реальное число запросов "в полёте" ограничивает контроллер.
+        """
+        with ThreadPoolExecutor(max_workers=self.controller.max_limit) as pool:
+            futures = [pool.submit(self.generate, sp, ut) for sp, ut in requests_list]
+            return [f.result() for f in futures]
+
+    def metrics(self) -> dict:
+        return {"model": self.model, "host": self.host, **self.controller.metrics()}
+
+    def health_check(self) -> bool:
+        """
+        Быстрая проверка, что инстанс Ollama жив и отвечает.
+        """
+        try:
+            response = requests.get(f"{self.host}/api/tags", timeout=5)
+            return response.ok
+        except requests.RequestException:
+            return False
@@ -0,0 +1,192 @@
+import os
+import time
+import datetime
+import heapq
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from pypdf import PdfReader
+
+
+POLICIES = ("smallest", "newest", "pages", "none")
+
+
+class PdfFile:
+    def __init__(self, path: str, size: int, mtime: float, pages: Optional[int] = None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.pages = pages
+
+    def __repr__(self) -> str:
+        return f"PdfFile({self.path!r}, size={self.size}, pages={self.pages})"
+
+
+def count_pages(pdf_path: str) -> Optional[int]:
+    try:
+        return len(PdfReader(pdf_path).pages)
+    except Exception:
+        return None
+
+
+def matches(rel_path: str, include: Sequence[str], exclude: Sequence[str]) -> bool:
+    """
+    Glob-фильтр по пути относительно корня (разделители приводятся к "/").
+    Проверяем и полный относительный путь, и имя файла.
+    """
+    rel_path = rel_path.replace(os.sep, "/")
+    name = rel_path.rsplit("/", 1)[-1]
+
+    def hit(patterns: Sequence[str]) -> bool:
+        return any(
+            fnmatch.fnmatch(rel_path.lower(), p.lower()) or fnmatch.fnmatch(name.lower(), p.lower())
+            for p in patterns
+        )
+
+    if include and not hit(include):
+        return False
+    if exclude and hit(exclude):
+        return False
+    return True
+
+
+class PdfScheduler:
+    """
+    Параллельный обход папки (os.scandir в пуле потоков) + очередь с приоритетом.
+
+    Первый файл отдаётся после окончания обхода или через warmup секунд — что раньше
+    (обход дешевле OCR, а выбор из неполного списка может поставить первым огромную книгу).
+    Дальше — лучший по политике из найденных, пока обход продолжается в фоне.
+
+    policy:
+    - smallest — сначала маленькие файлы
+    - newest   — сначала недавно изменённые
+    - pages    — сначала с меньшим числом страниц (требует открыть каждый PDF)
+    - none     — в порядке обнаружения
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+        policy: str = "smallest",
+        include: Sequence[str] = ("*.pdf",),
+        exclude: Sequence[str] = (),
+        workers: int = 8,
+        warmup: float = 60.0,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scan policy: {policy}, expected one of {POLICIES}")
+
+        self.root_dir = root_dir
+        self.policy = policy
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.workers = max(1, workers)
+        self.warmup = warmup
+
+        self._heap: List[Tuple[tuple, int, PdfFile]] = []
+        self._seq = 0
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    # -----------------------------------------------------
+    # scan
+    # -----------------------------------------------------
+
+    def _priority(self, f: PdfFile) -> tuple:
+        if self.policy == "smallest":
+            return (f.size,)
+        if self.policy == "newest":
+            return (-f.mtime,)
+        if self.policy == "pages":
+            return (f.pages if f.pages is not None else float("inf"), f.size)
+        return ()
+
+    def _submit(self, path: str) -> None:
+        with self._cond:
+            self._pending += 1
+        try:
+            self._pool.submit(self._scan_dir, path)
+        except Exception:
+            # пул уже закрыт (итерацию прервали) — задача не будет выполнена
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+            raise
+
+    def _scan_dir(self, path: str) -> None:
+        found: List[PdfFile] = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            self._submit(entry.path)
+                            continue
+                        # .pdf обязателен всегда; INCLUDE/EXCLUDE только сужают выбор
+                        if not entry.name.lower().endswith(".pdf") or not entry.is_file():
+                            continue
+
+                        rel = os.path.relpath(entry.path, self.root_dir)
+                        if not matches(rel, self.include, self.exclude):
+                            continue
+
+                        st = entry.stat()
+                        found.append(PdfFile(entry.path, st.st_size, st.st_mtime))
+                    except OSError:
+                        continue
+
+            if self.policy == "pages":
+                for f in found:
+                    f.pages = count_pages(f.path)
+        except Exception as e:
+            print(datetime.datetime.now(), f"[SCAN] Cannot read {path}: {type(e).__name__}: {e}")
+        finally:
+            # пачкой кладём всё найденное в директории; _pending уменьшаем в любом случае,
+            # иначе потребитель навсегда застрянет в ожидании
+            with self._cond:
+                for f in found:
+                    heapq.heappush(self._heap, (self._priority(f), self._seq, f))
+                    self._seq += 1
+                self._pending -= 1
+                self._cond.notify_all()
+
+    # -----------------------------------------------------
+    # iterate
+    # -----------------------------------------------------
+
+    def __iter__(self) -> Iterator[PdfFile]:
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan")
+        try:
+            self._submit(self.root_dir)
+
+            deadline = time.monotonic() + self.warmup
+            with self._cond:
+                while self._pending > 0:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+
+            while True:
+                with self._cond:
+                    while not self._heap and self._pending > 0:
+                        self._cond.wait()
+                    if not self._heap:
+                        return
+                    _, _, item = heapq.heappop(self._heap)
+                yield item
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def scan_all(self) -> List[PdfFile]:
+        """
+        Полный список в порядке политики (ждёт окончания обхода).
+        """
+        files = list(self)
+        files.sort(key=self._priority)
+        return files
@@ -0,0 +1,58 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Optional
+
+
+class RunManifest:
+    """
+    JSON-манифест прогона: путь PDF → сведения о нём (язык и т.п.).
+    Запись привязана к размеру и mtime файла — если PDF поменялся, запись считается устаревшей.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.entries = {}
+
+    @staticmethod
+    def _key(pdf_path: str) -> str:
+        return os.path.abspath(pdf_path)
+
+    @staticmethod
+    def _stamp(pdf_path: str) -> Dict[str, Any]:
+        st = os.stat(pdf_path)
+        return {"size": st.st_size, "mtime": st.st_mtime}
+
+    def get(self, pdf_path: str, field: str) -> Optional[Any]:
+        entry = self.entries.get(self._key(pdf_path))
+        if not entry:
+            return None
+        stamp = self._stamp(pdf_path)
+        if entry.get("size") != stamp["size"] or entry.get("mtime") != stamp["mtime"]:
+            return None
+        return entry.get(field)
+
+    def set(self, pdf_path: str, field: str, value: Any) -> None:
+        key = self._key(pdf_path)
+        stamp = self._stamp(pdf_path)
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry or entry.get("size") != stamp["size"] or entry.get("mtime") != stamp["mtime"]:
+                entry = dict(stamp)
+                self.entries[key] = entry
+            entry[field] = value
+
+    def save(self) -> None:
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
@@ -0,0 +1,89 @@
+import json
+import os
+
+import corpus_index
+from corpus_index import CorpusIndex
+
+
+SECTION_TEXT = "Теорема Пифагора: квадрат гипотенузы равен сумме квадратов катетов."
+
+
+def write_json(path, data, mtime=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def document():
+    return {
+        "type": "document",
+        "title": "Геометрия",
+        "children": [{
+            "type": "chapter", "title": "Треугольники",
+            "children": [{
+                "type": "paragraph", "title": "Прямоугольный треугольник",
+                "children": [{"type": "section", "title": None, "section_type": "theorem", "text": SECTION_TEXT}],
+            }],
+        }],
+    }
+
+
+def dedoc(page_id):
+    return {"content": {"structure": {"text": "", "subparagraphs": [
+        {"text": "Предисловие", "metadata": {"page_id": 0}, "subparagraphs": []},
+        {"text": SECTION_TEXT, "metadata": {"page_id": page_id}, "subparagraphs": []},
+    ]}}}
+
+
+def count_loads(monkeypatch):
+    loads = []
+    original = corpus_index.load_document
+
+    def load_document(path):
+        loads.append(os.path.basename(path))
+        return original(path)
+
+    monkeypatch.setattr(corpus_index, "load_document", load_document)
+    return loads
+
+
+def section_pages(index):
+    row = index.conn.execute("SELECT page_start, page_end FROM sections").fetchone()
+    return row["page_start"], row["page_end"]
+
+
+def test_non_documents_are_not_reloaded(tmp_path, monkeypatch):
+    write_json(tmp_path / "book.json", document())
+    write_json(tmp_path / "raw_llm_output.json", {"answer": "..."})
+    write_json(tmp_path / ".run_manifest.json", {"files": {}})
+
+    with CorpusIndex(str(tmp_path / "corpus.sqlite")) as index:
+        loads = count_loads(monkeypatch)
+        assert index.index_directory(str(tmp_path)) == 1
+        assert sorted(loads) == ["book.json", "raw_llm_output.json"]
+
+        loads.clear()
+        assert index.index_directory(str(tmp_path)) == 0
+        assert loads == []
+
+        # изменённый не-документ проверяется снова
+        write_json(tmp_path / "raw_llm_output.json", {"answer": "...", "more": 1})
+        assert index.index_directory(str(tmp_path)) == 0
+        assert loads == ["raw_llm_output.json"]
+
+
+def test_newer_dedoc_sidecar_refreshes_pages(tmp_path):
+    book = tmp_path / "book.json"
+    write_json(book, document(), mtime=1_000_000)
+    write_json(tmp_path / "book.rus.dedoc.json", dedoc(page_id=4), mtime=1_000_000)
+
+    with CorpusIndex(str(tmp_path / "corpus.sqlite")) as index:
+        assert index.index_file(str(book))
+        assert section_pages(index) == (5, 5)
+        assert not index.index_file(str(book))
+
+        # OCR переделан — JSON книги тот же, sidecar новее
+        write_json(tmp_path / "book.rus.dedoc.json", dedoc(page_id=6), mtime=1_000_100)
+        assert index.index_file(str(book))
+        assert section_pages(index) == (7, 7)
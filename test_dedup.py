@@ -0,0 +1,45 @@
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+from dedup import missing_page_ranges, page_hashes
+
+
+def scanned_page(writer, image_data):
+    """
+    Страница как у скана: один JBIG2-образ (pypdf его не декодирует) и одинаковый content stream.
+    """
+    page = writer.add_blank_page(100, 100)
+    if image_data is None:
+        return
+
+    image = DecodedStreamObject()
+    image.set_data(image_data)
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(1),
+        NameObject("/Height"): NumberObject(1),
+        NameObject("/BitsPerComponent"): NumberObject(1),
+        NameObject("/Filter"): NameObject("/JBIG2Decode"),
+    })
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): writer._add_object(image)}),
+    })
+
+
+def test_page_hashes_use_raw_image_bytes(tmp_path):
+    writer = pypdf.PdfWriter()
+    for data in [b"cover", b"page 2", b"cover", None, b"page 5"]:
+        scanned_page(writer, data)
+    path = tmp_path / "book.pdf"
+    writer.write(str(path))
+
+    hashes = page_hashes(str(path))
+
+    assert hashes[0] == hashes[2]
+    assert len({hashes[0], hashes[1], hashes[4]}) == 3
+    # без изображения — не кешируется
+    assert hashes[3] is None
+    assert missing_page_ranges(hashes, {hashes[0], hashes[1], hashes[4]}) == [(3, 3)]
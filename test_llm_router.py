@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from llm_interface import BaseLLMClient
+from llm_router import Backend, RouterClient
+
+
+class FakeClient(BaseLLMClient):
+    def __init__(self, reply: str = "ok", fail: bool = False):
+        self.reply = reply
+        self.fail = fail
+        self.calls = 0
+
+    def generate(self, system_prompt: str, user_text: str) -> str:
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("backend down")
+        return self.reply
+
+
+class FirstChoice:
+    """
+    Вместо случайного выбора — всегда первый кандидат (порядок бэкендов в тесте задан явно).
+    """
+
+    def choices(self, population, weights=None, k=1):
+        return [population[0]]
+
+
+def make_router(backends, **kwargs):
+    kwargs.setdefault("health_check_interval", 0)
+    return RouterClient(backends, log=lambda message: None, rng=FirstChoice(), **kwargs)
+
+
+def test_failover_to_next_backend():
+    broken = FakeClient(fail=True)
+    spare = FakeClient(reply="spare")
+    router = make_router([
+        Backend(broken, name="broken", failure_threshold=2),
+        Backend(spare, name="spare"),
+    ])
+
+    assert router.generate("system", "text") == "spare"
+    assert router.generate("system", "text") == "spare"
+    assert broken.calls == 2
+
+    # после failure_threshold ошибок подряд цепь разомкнута — сломанный бэкенд больше не трогаем
+    assert router.generate("system", "text") == "spare"
+    assert broken.calls == 2
+    assert router.stats()[0]["state"] == "open"
+
+
+def test_failed_half_open_probe_reopens_breaker():
+    client = FakeClient(fail=True)
+    backend = Backend(client, name="flaky", failure_threshold=1, reset_timeout=0.05)
+    router = make_router([backend], max_wait=1.0)
+
+    with pytest.raises(RuntimeError):
+        router.generate("system", "text")
+    assert backend.breaker.state == "open"
+
+    time.sleep(0.06)
+    assert backend.breaker.state == "half_open"
+
+    # пробный запрос упал — цепь снова открыта на полный reset_timeout
+    with pytest.raises(RuntimeError):
+        router.generate("system", "text")
+    assert client.calls == 2
+    assert backend.breaker.state == "open"
+    assert backend.breaker.retry_in() > 0.03
+
+    client.fail = False
+    assert router.generate("system", "text") == "ok"
+    assert backend.breaker.state == "closed"
+
+
+def test_wait_for_half_open_gives_up_after_max_wait():
+    backend = Backend(FakeClient(fail=True), name="down", failure_threshold=1, reset_timeout=30.0)
+    router = make_router([backend], max_wait=0.2)
+
+    with pytest.raises(RuntimeError):
+        router.generate("system", "text")
+
+    # до half_open дольше, чем max_wait, — отказ сразу, без сна
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match="No available LLM backends"):
+        router.generate("system", "text")
+    assert time.monotonic() - t0 < 0.1
+
+
+def test_wait_for_half_open_times_out_while_other_probe_runs():
+    backend = Backend(FakeClient(), name="probing", failure_threshold=1, reset_timeout=0.0)
+    backend.breaker.on_failure()
+    backend.breaker.on_start()  # пробный запрос "идёт" из другого потока
+    router = make_router([backend], max_wait=0.6)
+
+    t0 = time.monotonic()
+    assert router._wait_for_half_open(exclude=[]) is None
+    assert 0.4 <= time.monotonic() - t0 < 1.0
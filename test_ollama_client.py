@@ -0,0 +1,241 @@
+import heapq
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from adaptive_concurrency import AdaptiveConcurrency
+from ollama_client import OllamaClient
+from text_cleaner import TextCleaner
+
+
+SERVICE_TIME = 0.02
+CAPACITY = 4
+TOKENS = 100
+
+
+class FifoCapacity:
+    """
+    Как Ollama с OLLAMA_NUM_PARALLEL=capacity: одновременно обрабатывается не больше
+    capacity запросов, остальные ждут в очереди по порядку.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.busy = 0
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.active = 0
+        self.peak = 0
+        self.samples = []
+        self.options = []  # options последних запросов
+
+    def __enter__(self):
+        with self.cond:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.samples.append(self.active)
+            me = object()
+            self.queue.append(me)
+            while self.queue[0] is not me or self.busy >= self.capacity:
+                self.cond.wait()
+            self.queue.popleft()
+            self.busy += 1
+            self.cond.notify_all()
+
+    def __exit__(self, *exc):
+        with self.cond:
+            self.busy -= 1
+            self.active -= 1
+            self.cond.notify_all()
+
+
+def make_handler(capacity: FifoCapacity):
+    class FakeOllama(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            user_text = body["messages"][1]["content"]
+            capacity.options.append(body.get("options", {}))
+
+            with capacity:
+                time.sleep(SERVICE_TIME)
+
+            # пачка для TextCleaner — возвращаем те же id с "очищенным" текстом
+            try:
+                items = json.loads(user_text)["items"]
+                content = json.dumps(
+                    {"items": [{"id": i["id"], "text": i["text"].upper()} for i in items]},
+                    ensure_ascii=False,
+                )
+            except (ValueError, KeyError, TypeError):
+                content = user_text.upper()
+
+            out = json.dumps({
+                "message": {"content": content},
+                "prompt_eval_count": TOKENS // 2,
+                "eval_count": TOKENS // 2,
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    return FakeOllama
+
+
+@pytest.fixture
+def fake_ollama():
+    capacity = FifoCapacity(CAPACITY)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(capacity))
+    server.daemon_threads = True
+    server.request_queue_size = 64
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", capacity
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def simulate(controller, n, capacity, seed=0):
+    """
+    Детерминированная модель Ollama с ёмкостью capacity (FIFO) на виртуальных часах:
+    время ответа ~ накладные + префилл + генерация, с разбросом ±25% и промптами разной длины.
+    Возвращает (лимит после каждого завершения, реальную пропускную способность в токенах/с).
+    """
+    rng = random.Random(seed)
+    free_at = [0.0] * capacity
+    events = []
+    limits = []
+    dispatched = done = total_tokens = 0
+
+    while done < n:
+        while dispatched < n and controller.metrics()["in_flight"] < controller.limit:
+            slot = controller.slot()
+            ticket = slot.__enter__()
+            prompt_tokens = rng.choice([50, 200, 1500])
+            output_tokens = rng.randint(50, 300)
+            service = (0.2 + 0.0003 * prompt_tokens + 0.02 * output_tokens) * rng.uniform(0.8, 1.25)
+            server = min(range(capacity), key=free_at.__getitem__)
+            start = max(clock.now, free_at[server])
+            free_at[server] = start + service
+            heapq.heappush(events, (
+                start + service, dispatched, slot, ticket, start + service - clock.now,
+                prompt_tokens, output_tokens,
+            ))
+            dispatched += 1
+
+        finish, _, slot, ticket, latency, prompt_tokens, output_tokens = heapq.heappop(events)
+        clock.now = finish
+        controller.record(
+            latency, prompt_tokens * 3, tokens=prompt_tokens + output_tokens,
+            ticket=ticket, output_tokens=output_tokens,
+        )
+        slot.__exit__(None, None, None)
+
+        done += 1
+        total_tokens += prompt_tokens + output_tokens
+        limits.append(controller.limit)
+
+    return limits, total_tokens / clock.now
+
+
+class Clock:
+    now = 0.0
+
+
+clock = Clock()
+
+
+@pytest.mark.parametrize("capacity, low, high", [(4, 3, 8), (2, 1, 5)])
+def test_controller_converges_near_server_capacity(capacity, low, high):
+    clock.now = 0.0
+    controller = AdaptiveConcurrency(max_limit=8, clock=lambda: clock.now)
+
+    limits, real_tps = simulate(controller, n=2000, capacity=capacity)
+
+    steady = limits[len(limits) // 5:]
+    assert low <= min(steady) and max(steady) <= high
+    # шум и разная длина промптов не загоняют лимит ниже ёмкости сервера
+    assert sum(steady) / len(steady) >= capacity
+    assert sum(limit >= capacity for limit in steady) / len(steady) >= 0.9
+
+    # сервер загружен полностью: ~capacity запросов по ~758 токенов за ~3.9 с
+    assert real_tps >= 0.95 * capacity * 758 / 3.95
+    assert controller.metrics()["throughput_tps"] == pytest.approx(real_tps, rel=0.25)
+
+
+def test_concurrent_requests_against_fake_server(fake_ollama):
+    host, capacity = fake_ollama
+    client = OllamaClient(host=host, controller=AdaptiveConcurrency(max_limit=8))
+
+    results = client.generate_many([("system", "x" * 500)] * 100)
+
+    assert results == ["X" * 500] * 100
+    assert client.metrics()["failures_total"] == 0
+    assert 1 < capacity.peak <= 8
+
+
+def test_sequential_caller_does_not_inflate_limit(fake_ollama):
+    host, _ = fake_ollama
+    client = OllamaClient(host=host, controller=AdaptiveConcurrency(max_limit=8))
+
+    for _ in range(20):
+        client.generate("system", "text")
+
+    # вызовы по одному — окно ни разу не было заполнено больше, чем на 1–2
+    assert client.metrics()["limit"] <= 2
+
+
+def test_timeout_grows_after_failures():
+    controller = AdaptiveConcurrency(min_timeout=1.0, max_timeout=1000.0)
+    assert controller.timeout_for(1000) == 1000.0  # без наблюдений — максимум
+
+    with controller.slot() as ticket:
+        controller.record(2.0, 1000, tokens=100, ticket=ticket)
+    base = controller.timeout_for(1000)
+
+    with controller.slot() as ticket:
+        controller.record(base, 1000, ok=False, ticket=ticket)
+    widened = controller.timeout_for(1000)
+
+    assert widened >= 2 * base
+
+    # эпоха с ошибкой закрывается уменьшением лимита
+    assert controller.limit == 2
+    with controller.slot() as ticket:
+        controller.record(2.0, 1000, tokens=100, ticket=ticket)
+    assert controller.limit == 1
+
+
+def test_text_cleaner_sends_batches_in_parallel(fake_ollama):
+    host, capacity = fake_ollama
+    client = OllamaClient(host=host, controller=AdaptiveConcurrency(initial_limit=4, max_limit=4))
+    cleaner = TextCleaner(client, small_section_tokens=50, context_tokens=300)
+
+    sections = [{"text": f"секция {i} b {{ c"} for i in range(40)]
+    cleaner.clean_sections(sections)
+
+    assert all(s["text"] == f"СЕКЦИЯ {i} B {{ C" for i, s in enumerate(sections))
+    assert capacity.peak > 1
+
+
+def test_batches_fit_the_context_window_sent_to_ollama(fake_ollama):
+    host, capacity = fake_ollama
+    client = OllamaClient(host=host, num_ctx=4096)
+    cleaner = TextCleaner(client)
+
+    assert cleaner.context_tokens == 4096
+    assert cleaner.max_batch_tokens < 4096 // 2
+
+    client.generate("system", "text")
+    assert capacity.options[-1]["num_ctx"] == 4096
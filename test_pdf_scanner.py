@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+pytest.importorskip("pypdf")
+
+from pdf_scanner import PdfScheduler
+
+
+def make_tree(root):
+    files = {
+        "a.pdf": 30,
+        "B.PDF": 10,
+        "notes.txt": 1,
+        "Math/algebra.pdf": 20,
+        "Math/answers.txt": 2,
+        "Math/scan.djvu": 3,
+        "Physics/deep/optics.pdf": 40,
+    }
+    for rel, size in files.items():
+        path = os.path.join(root, *rel.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+
+
+def names(scheduler):
+    return [os.path.basename(f.path) for f in scheduler]
+
+
+@pytest.mark.parametrize(
+    "include, expected",
+    [
+        (["*.pdf"], ["B.PDF", "algebra.pdf", "a.pdf", "optics.pdf"]),
+        ([], ["B.PDF", "algebra.pdf", "a.pdf", "optics.pdf"]),
+        (["Math/*"], ["algebra.pdf"]),
+    ],
+)
+def test_only_pdf_files_are_scheduled(tmp_path, include, expected):
+    make_tree(str(tmp_path))
+    scheduler = PdfScheduler(str(tmp_path), policy="smallest", include=include, workers=2, warmup=5.0)
+    assert names(scheduler) == expected
+
+
+def test_exclude_globs_apply_on_top_of_pdf_filter(tmp_path):
+    make_tree(str(tmp_path))
+    scheduler = PdfScheduler(str(tmp_path), include=[], exclude=["Physics/*"], workers=2, warmup=5.0)
+    assert names(scheduler) == ["B.PDF", "algebra.pdf", "a.pdf"]
@@ -1,4 +1,9 @@
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from safe_json_loads import safe_json_loads
 
 
 CLEAN_PROMPT = """
@@ -13,10 +18,61 @@ CLEAN_PROMPT = """
 """
 
 
+BATCH_CLEAN_PROMPT = """
+Очисти каждый фрагмент текста по отдельности:
+
+- убери переносы внутри слов
+- убери случайные цифры страниц
+- убери мусорные символы
+- сохрани исходный текст
+- не перефразируй
+- не объединяй и не разделяй фрагменты
+
+На вход приходит JSON: {"items": [{"id": <число>, "text": <строка>}, ...]}
+Верни ТОЛЬКО JSON того же вида с теми же id:
+{"items": [{"id": <число>, "text": <очищенный текст>}, ...]}
+"""
+
+
+# грубая оценка для смешанного рус/англ текста
+CHARS_PER_TOKEN = 3.0
+# окно Ollama по умолчанию — если клиент не сообщает своё num_ctx
+DEFAULT_CONTEXT_TOKENS = 2048
+# служебные токены JSON на один элемент пачки ({"id": .., "text": ..})
+ITEM_OVERHEAD_TOKENS = 12
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
 class TextCleaner:
 
-    def __init__(self, llm):
+    def __init__(
+        self,
+        llm,
+        small_section_tokens: int = 500,
+        context_tokens: Optional[int] = None,
+        max_batch_items: int = 20,
+        workers: Optional[int] = None,
+    ):
         self.llm = llm
+        # сколько пачек отправлять параллельно; по умолчанию — сколько допускает клиент
+        # (у OllamaClient фактическое число запросов в полёте регулирует его контроллер)
+        self.workers = workers or getattr(llm, "max_parallel", 1)
+        # секции короче small_section_tokens упаковываются в один запрос
+        self.small_section_tokens = small_section_tokens
+        # context_tokens — окно модели (num_ctx). В него входят промпт, пачка и ответ,
+        # а ответ примерно равен пачке по размеру → на пачку остаётся половина.
+        # По умолчанию берём окно, которое клиент реально передаёт серверу
+        if context_tokens is None:
+            context_tokens = getattr(llm, "num_ctx", None) or DEFAULT_CONTEXT_TOKENS
+        self.context_tokens = context_tokens
+        self.max_batch_tokens = max(
+            small_section_tokens,
+            (context_tokens - estimate_tokens(BATCH_CLEAN_PROMPT)) // 2
+        )
+        self.max_batch_items = max_batch_items
 
     def clean_text(self, text: str) -> str:
         t0 = time.time()
@@ -30,21 +86,141 @@ class TextCleaner:
 
         return cleaned.strip()
 
+    def clean_batch(self, texts: List[str]) -> List[str]:
+        """
+        Очищает несколько коротких текстов одним запросом.
+        Если ответ не удалось разобрать по id — откатываемся на поштучную очистку.
+        """
+        if len(texts) == 1:
+            return [self.clean_text(texts[0])]
+
+        t0 = time.time()
+        payload = json.dumps(
+            {"items": [{"id": i, "text": t} for i, t in enumerate(texts)]},
+            ensure_ascii=False
+        )
+
+        try:
+            response = self.llm.generate(
+                system_prompt=BATCH_CLEAN_PROMPT,
+                user_text=payload
+            )
+            cleaned = self._split_batch_response(response, len(texts))
+        except Exception as e:
+            print(f"[CLEAN] batch of {len(texts)} failed ({type(e).__name__}: {e}), fallback to per-item")
+            return [self.clean_text(t) for t in texts]
+
+        print(
+            f"[CLEAN] batch x{len(texts)} {sum(map(len, texts))} → {sum(map(len, cleaned))}"
+            f" | {time.time() - t0:.1f}s"
+        )
+
+        return cleaned
+
+    @staticmethod
+    def _split_batch_response(response: str, expected: int) -> List[str]:
+        by_id: Dict[int, str] = {}
+
+        # Ollama с format=json отдаёт ровно один JSON-объект; safe_json_loads —
+        # запасной путь для ответов с markdown/мусором вокруг (он не учитывает
+        # скобки внутри строк, поэтому не первый)
+        try:
+            objects = [json.loads(response)]
+        except (TypeError, json.JSONDecodeError):
+            objects = safe_json_loads(response)
+
+        for obj in objects:
+            items = obj.get("items") if isinstance(obj, dict) else None
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                item_id = item.get("id")
+                text = item.get("text")
+                if isinstance(item_id, int) and isinstance(text, str):
+                    by_id[item_id] = text.strip()
+
+        if sorted(by_id) != list(range(expected)):
+            raise ValueError(f"Batch response ids mismatch: got {len(by_id)} of {expected}")
+
+        return [by_id[i] for i in range(expected)]
+
+    def _pack_sections(self, sections: List[dict]) -> List[List[dict]]:
+        """
+        Упаковывает короткие секции в пачки в пределах бюджета по токенам.
+        Длинные секции идут отдельными запросами.
+        """
+        batches: List[List[dict]] = []
+        current: List[dict] = []
+        size = 0
+
+        for section in sections:
+            tokens = estimate_tokens(section.get("text") or "")
+
+            if tokens >= self.small_section_tokens:
+                batches.append([section])
+                continue
+
+            tokens += ITEM_OVERHEAD_TOKENS
+
+            if current and (
+                size + tokens > self.max_batch_tokens
+                or len(current) >= self.max_batch_items
+            ):
+                batches.append(current)
+                current = []
+                size = 0
+
+            current.append(section)
+            size += tokens
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    def clean_sections(self, sections: List[dict]) -> List[dict]:
+        non_empty = [s for s in sections if (s.get("text") or "").strip()]
+
+        batches = self._pack_sections(non_empty)
+
+        def run(batch: List[dict]) -> None:
+            cleaned = self.clean_batch([s["text"] for s in batch])
+            for section, text in zip(batch, cleaned):
+                section["text"] = text
+
+        if self.workers <= 1 or len(batches) <= 1:
+            for batch in batches:
+                run(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for future in [pool.submit(run, batch) for batch in batches]:
+                    future.result()
+
+        return sections
+
     def clean_section(self, section: dict) -> dict:
         section["text"] = self.clean_text(section["text"])
         return section
 
     def clean_paragraph(self, paragraph: dict) -> dict:
-        for section in paragraph["children"]:
-            self.clean_section(section)
+        self.clean_sections(paragraph["children"])
         return paragraph
 
     def clean_chapter(self, chapter: dict) -> dict:
-        for paragraph in chapter["children"]:
-            self.clean_paragraph(paragraph)
+        self.clean_sections([
+            section
+            for paragraph in chapter["children"]
+            for section in paragraph["children"]
+        ])
         return chapter
 
     def clean_document(self, document: dict) -> dict:
-        for chapter in document["children"]:
-            self.clean_chapter(chapter)
+        self.clean_sections([
+            section
+            for chapter in document["children"]
+            for paragraph in chapter["children"]
+            for section in paragraph["children"]
+        ])
         return document
@@ -65,3 +65,13 @@ def parse_toc(dedoc_json: Dict[str, Any]) -> Dict[str, int]:
         toc_map[line["title"]] = indent_to_level.get(line["indent"], 0)
 
     return toc_map
+
+
+def parse_toc_from_pdf(pdf_path: str, language: str) -> Dict[str, int]:
+    """
+    TOC по PDF без повторного OCR: берёт результат из общего DedocService
+    (память / .dedoc.json), OCR запускается только если кеша ещё нет.
+    """
+    from dedoc_service import get_dedoc_service
+
+    return parse_toc(get_dedoc_service().parse(pdf_path, language=language))